@@ -3,6 +3,7 @@ from aostools import climate as ac
 from matplotlib import pyplot as plt
 import seaborn as sns
 import numpy as np
+from DynVar_SH_SSW.functions import OpenMFDataset
 import argparse
 parser = argparse.ArgumentParser()
 parser.add_argument('-l',dest='levels',default=None,nargs='+',help='list of pressure levels [hPa] to analyse')
@@ -12,9 +13,16 @@ parser.add_argument('-x',dest='xlims',default=[0.8,3.2],nargs=2,type=float,help=
 parser.add_argument('-y',dest='ylims',default=[58,93],nargs=2,type=float,help='set y-limits for plot (central latitude).')
 parser.add_argument('-m',dest='max',action='store_true',help='look for rolling mean max of aspect ration and min of centroid latitude.')
 parser.add_argument('-r',dest='roll',default=7,help='rolling max/min for aspect ration in days. Only used if -m.')
+parser.add_argument('-w',dest='sweep',action='store_true',help='read edge sweep files (compute_vortex_moments.py -E) instead of one file per edge.')
+parser.add_argument('-n',dest='nedges',default=9,type=int,help='number of edges to pick from edge sweep files if -e is not given. Only used if -w.')
 args = parser.parse_args()
 
 
+if args.sweep:
+    file_template = 'vxmoms/ERA5_vxmoms_????_{0}hPa_sweep.nc'
+else:
+    file_template = 'vxmoms/ERA5_vxmoms_????_{0}hPa_{1}km.nc'
+
 if args.levels is None:
     from glob import glob
     all_files = glob('vxmoms/*.nc')
@@ -36,10 +44,20 @@ nedges = 0
 dl = []
 for l,level in enumerate(levels):
     dss = []
+    if args.sweep:
+        # all edges of all years in one dataset, opened once per level
+        sweep_ds = OpenMFDataset(file_template.format(level))
+        sweep_edges = sweep_ds.edge.values
+        # half the sweep spacing: edges off the sweep grid raise KeyError
+        sweep_tol = 0.5*float(np.min(np.diff(sweep_edges))) if len(sweep_edges) > 1 else 1e-6
     for season in seasons:
-        if args.edges is None:
+        if args.edges is None and args.sweep:
+            # evenly spaced subset of the edges in the sweep, without float noise
+            edges = sweep_edges[np.linspace(0,len(sweep_edges)-1,min(args.nedges,len(sweep_edges))).round().astype(int)]
+            edges = np.round(edges,3)
+        elif args.edges is None:
             from glob import glob
-            all_files = glob('vxmoms/*_{0}hPa_*.nc'.format(level))
+            all_files = glob('vxmoms/*_{0}hPa_*km.nc'.format(level))
             all_files.sort()
             edges  = [float(i.split('km')[0].split('_')[-1]) for i in all_files]
             edges  = np.unique(edges)
@@ -48,8 +66,11 @@ for l,level in enumerate(levels):
         nedges = len(edges)
         de = []
         for edge in edges:
-            inFiles = 'vxmoms/ERA5_vxmoms_????_{0}hPa_{1}km.nc'.format(level,edge)
-            ds = xr.open_mfdataset(inFiles)
+            if args.sweep:
+                ds = sweep_ds.sel(edge=float(edge),method='nearest',tolerance=sweep_tol).drop_vars('edge')
+            else:
+                inFiles = file_template.format(level,edge)
+                ds = OpenMFDataset(inFiles)
             if args.max:
                 # aspect ratio: looking for above threshold
                 ds['aspect_ratio'] = ds.aspect_ratio.rolling(time=args.roll).min()
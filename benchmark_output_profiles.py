@@ -0,0 +1,78 @@
+import xarray as xr
+import numpy as np
+import pandas as pd
+import os
+import time
+import tempfile
+from glob import glob
+from DynVar_SH_SSW.functions import ToNetCDF, OpenMFDataset
+import argparse
+parser = argparse.ArgumentParser(description='Compare file size and read time of xarray default netCDF output with the tuned output profile, using synthetic yearly vortex moment files.')
+parser.add_argument('-n',dest='nyears',default=40,type=int,help='Number of yearly files.')
+parser.add_argument('-e',dest='nedges',default=201,type=int,help='Number of edges per file (1 for single edge files).')
+parser.add_argument('-r',dest='repeat',default=3,type=int,help='Number of repetitions of read timing. The fastest is reported.')
+parser.add_argument('-d',dest='outDir',default=None,help='Directory for temporary files. If None, use system default.')
+args = parser.parse_args()
+
+def SyntheticYear(year):
+    time_ax = pd.date_range('{0}-01-01'.format(year),'{0}-12-31'.format(year),freq='D')
+    edges = np.linspace(28,32,args.nedges)
+    rng = np.random.default_rng(year)
+    shape = (len(time_ax),args.nedges)
+    data = {
+        'aspect_ratio':       1+np.abs(rng.normal(0.5,0.3,shape)),
+        'centroid_latitude':  rng.normal(80,5,shape),
+        'centroid_longitude': rng.uniform(0,360,shape),
+    }
+    coords = [('time',time_ax),('edge',edges)]
+    return xr.merge([xr.DataArray(v,coords=coords,name=k) for k,v in data.items()])
+
+def TimeRead(pattern,opener):
+    best = np.inf
+    for r in range(args.repeat):
+        t0 = time.perf_counter()
+        with opener(pattern) as ds:
+            ds.aspect_ratio.isel(edge=args.nedges//2).load()
+        best = min(best,time.perf_counter()-t0)
+    return best
+
+with tempfile.TemporaryDirectory(dir=args.outDir) as tmp:
+    for profile in ['default','timeseries']:
+        os.makedirs(os.path.join(tmp,profile))
+    write_time = {'default':0.,'timeseries':0.}
+    for year in range(1979,1979+args.nyears):
+        ds = SyntheticYear(year)
+        outFile = os.path.join(tmp,'default','vxmoms_{0}.nc'.format(year))
+        t0 = time.perf_counter()
+        ds.to_netcdf(outFile)
+        write_time['default'] += time.perf_counter()-t0
+        outFile = os.path.join(tmp,'timeseries','vxmoms_{0}.nc'.format(year))
+        t0 = time.perf_counter()
+        ToNetCDF(ds,outFile)
+        write_time['timeseries'] += time.perf_counter()-t0
+    # every file set is read with every opener, so that the effect of the
+    #  encoding and of the reader can be measured separately
+    openers = {'xr.open_mfdataset':xr.open_mfdataset,'OpenMFDataset':OpenMFDataset}
+    size = {}
+    read = {}
+    for profile in ['default','timeseries']:
+        files = glob(os.path.join(tmp,profile,'*.nc'))
+        size[profile] = sum(os.path.getsize(f) for f in files)/1024**2
+        for name,opener in openers.items():
+            read[profile,name] = TimeRead(os.path.join(tmp,profile,'*.nc'),opener)
+
+print('{0} files, {1} edges each; read = open all files and load one edge'.format(args.nyears,args.nedges))
+header = '{0:12s} {1:>10s} {2:>10s}'.format('profile','size[MiB]','write[s]')
+for name in openers:
+    header += ' {0:>24s}'.format('read['+name+'][s]')
+print(header)
+for profile in ['default','timeseries']:
+    line = '{0:12s} {1:10.2f} {2:10.2f}'.format(profile,size[profile],write_time[profile])
+    for name in openers:
+        line += ' {0:24.3f}'.format(read[profile,name])
+    print(line)
+print('size ratio (timeseries/default): {0:.2f}'.format(size['timeseries']/size['default']))
+for name in openers:
+    print('read speedup from encoding, both read with {0}: {1:.2f}'.format(name,read['default',name]/read['timeseries',name]))
+for profile in ['default','timeseries']:
+    print('read speedup from OpenMFDataset, {0} files: {1:.2f}'.format(profile,read[profile,'xr.open_mfdataset']/read[profile,'OpenMFDataset']))
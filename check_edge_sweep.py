@@ -0,0 +1,58 @@
+import xarray as xr
+import numpy as np
+from DynVar_SH_SSW.functions import OpenGeopotentialHeight, EdgeSweepMoments, EdgeSweepMomentsStep, CapCoordinates
+import argparse
+parser = argparse.ArgumentParser(description='Compare edge sweep moments (compute_vortex_moments.py -E) with vortex_moments.vor.calc_moments on ERA5 data (-z), or with the exact moments of an analytic vortex (-a).')
+parser.add_argument('-z',dest='z_file',default=None,help='Raw ERA5 geopotential file (SH cache is used if present).')
+parser.add_argument('-l',dest='level',default=10,type=float,help='Extract this pressure level.')
+parser.add_argument('-e',dest='edges',default=[30.5,31.0,32.0,33.0,34.0,35.0],nargs='+',type=float,help='Vortex edges [km] to compare.')
+parser.add_argument('-n',dest='ntimes',default=10,type=int,help='Number of time steps to compare.')
+parser.add_argument('-a',dest='analytic',default=None,nargs='+',type=float,help='Grid spacing(s) [degrees] for comparison with an analytic, non-elliptic vortex integrated on a fine Cartesian grid. Does not need ERA5 data or vortex_moments.')
+args = parser.parse_args()
+
+names = ['aspect_ratio','centroid_latitude','centroid_longitude']
+
+def MaxDiff(new,ref,name):
+    diff = np.abs(np.asarray(new)-np.asarray(ref))
+    if name == 'centroid_longitude':
+        diff = np.minimum(diff,360-diff)
+    return np.nanmax(diff)
+
+if args.analytic is not None:
+    # distorted ellipse centred off the pole, in stereographic coordinates
+    def AnalyticZ(x,y):
+        th  = np.arctan2(y,x-0.1)
+        rho = np.sqrt(((x-0.1)/0.4)**2+(y/0.2)**2)*(1+0.15*np.cos(3*th))+0.05*np.sin(7*x)*np.cos(5*y)+0.1*np.sin(4*y+1)
+        return 30000+5000*rho
+    edges = np.asarray(args.edges)*1000
+    # reference: uniform weights on a fine Cartesian grid covering the hemisphere
+    g = np.linspace(-1,1,4001)
+    X,Y = np.meshgrid(g,g)
+    Zc = np.where(np.hypot(X,Y) <= 1,AnalyticZ(X,Y),np.inf)
+    ref = EdgeSweepMomentsStep(Zc,edges,X,Y,np.ones_like(X))
+    print('{0:>10s} {1:>20s} {2:>12s}'.format('grid [deg]','variable','max |diff|'))
+    for res in args.analytic:
+        lats = np.arange(-90,0.01,res)
+        lons = np.arange(0,360,res)
+        lat_mask,x,y,w = CapCoordinates(lats,lons)
+        new = EdgeSweepMomentsStep(AnalyticZ(x,y),edges,x,y,w)
+        for n,nv,rv in zip(names,new,ref):
+            print('{0:10.2f} {1:>20s} {2:12.4f}'.format(res,n,MaxDiff(nv,rv,n)))
+    raise SystemExit
+
+from vortex_moments import vor
+z = OpenGeopotentialHeight([args.z_file]).sel(pres=args.level).isel(time=slice(0,args.ntimes)).load()
+sweep = EdgeSweepMoments(z,args.edges,hemisphere='SH')
+
+lats = z.lat.values
+lons = z.lon.values
+print('{0:>8s} {1:>20s} {2:>12s} {3:>12s} {4:>12s}'.format('edge','variable','vor','sweep','max |diff|'))
+for edge in args.edges:
+    ref = {n:np.zeros(len(z.time)) for n in names}
+    for t in range(len(z.time)):
+        moms = vor.calc_moments(z[t,:].values,lats,lons,hemisphere='SH',field_type='GPH',edge=edge*1000)
+        for n in names:
+            ref[n][t] = moms[n]
+    for n in names:
+        new = sweep[n].sel(edge=edge).values
+        print('{0:8.2f} {1:>20s} {2:12.3f} {3:12.3f} {4:12.3f}'.format(edge,n,np.nanmean(ref[n]),np.nanmean(new),MaxDiff(new,ref[n],n)))
@@ -3,45 +3,82 @@ from aostools import climate as ac
 from aostools import inout as ai
 from vortex_moments import vor
 import numpy as np
+import os
+from DynVar_SH_SSW.functions import FindSHCache, EdgeSweepMoments, NewPipelineStats, PrefetchChunks, StartWriter, WriteQueued, StopWriter, PrintPipelineStats
 import argparse
 parser = argparse.ArgumentParser()
-parser.add_argument('-z',dest='z_file',help='File containing Z10.')
+parser.add_argument('-z',dest='z_files',nargs='+',required=True,help='File(s) containing geopotential Z10 [m**2/s**2], e.g. raw ERA5 files. The next file is read while the current one is processed.')
 #parser.add_argument('-n',dest='label',help='label for file name.')
 parser.add_argument('-Z',dest='z10',default=None,help='Name of Z10 variable. If None, it is assumed there is only one variable in z_file.')
 parser.add_argument('-l',dest='level',default=None,type=float,help='Extract this pressure level.')
 parser.add_argument('-e',dest='edge',default=30.2,type=float,help='Value of edge of polar vortex [km].')
-parser.add_argument('-o',dest='outFile',help="Name of output file")
+parser.add_argument('-E',dest='sweep',default=None,nargs=3,type=float,help='Edge sweep: first and last edge [km] and number of edges. Computes moments for all edges from one sorted pass per time step, ignoring -e.')
+parser.add_argument('-o',dest='outFile',required=True,help="Name of output file. With several input files, {0} is replaced by the second dot-separated part of the input file name, e.g. the year of ERA5_dm.1979.z.nc.")
+parser.add_argument('-c',dest='cache_dir',default=None,help='SH cache directory (see create_sh_cache.py). If None, use sh_cache/ in the directory of z_file.')
+parser.add_argument('-t',dest='chunk',default=None,type=int,help='Number of time steps read at once. If None, read whole files.')
+parser.add_argument('-p',dest='depth',default=2,type=int,help='Number of chunks to read ahead.')
 args = parser.parse_args()
 
-if args.z10 is None:
-    z = xr.open_dataarray(args.z_file)
-else:
-    z = xr.open_dataset(args.z_file)[args.z10]
+def OpenZ(z_file):
+    # z_file is geopotential. if it has an SH cache, the cache is already
+    #  geopotential height on the standard grid
+    #  all operations are lazy: data are only read by the prefetch thread
+    cache_file = FindSHCache(z_file,args.cache_dir)
+    if cache_file is not None:
+        z = xr.open_dataset(cache_file)[args.z10 or 'z']
+        if args.level is not None:
+            z = z.sel(pres=args.level)
+    else:
+        if args.z10 is None:
+            z = xr.open_dataarray(z_file,chunks={})
+        else:
+            z = xr.open_dataset(z_file,chunks={})[args.z10]
+        z = ac.StandardGrid(z,rename=True)
+        if args.level is not None:
+            z = z.sel(pres=args.level)
+        # convert geopotential to geopotential height, as in the cache
+        z = z/9.81
+    return z
 
-z = ac.StandardGrid(z,rename=True)
-if args.level is not None:
-    z = z.sel(pres=args.level)
+def ComputeMoments(z):
+    if args.sweep is not None:
+        edges = np.linspace(args.sweep[0],args.sweep[1],int(args.sweep[2]))
+        return EdgeSweepMoments(z,edges,hemisphere='SH')
+    z10 = z.values
+    lons = z.lon.values
+    lats = z.lat.values
+    aspects = np.zeros(len(z.time),)
+    latc = np.zeros_like(aspects)
+    lonc=np.zeros_like(aspects)
+    nt=len(z.time)
+    for t in range(nt):
+             moms = vor.calc_moments(z10[t,:],lats,lons,hemisphere='SH',field_type='GPH',edge=args.edge*1000)
+             aspects[t] = moms['aspect_ratio']
+             latc[t] = moms['centroid_latitude']
+             lonc[t] = moms['centroid_longitude']
+    aspx = xr.DataArray(aspects,coords=[z.time],name='aspect_ratio')
+    latx = xr.DataArray(latc,coords=[z.time],name='centroid_latitude')
+    lonx = xr.DataArray(lonc,coords=[z.time],name='centroid_longitude')
+    return xr.merge([aspx,latx,lonx])
 
-z10 = z.values
-
-lons = z.lon.values
-lats = z.lat.values
-aspects = np.zeros(len(z.time),)
-latc = np.zeros_like(aspects)
-lonc=np.zeros_like(aspects)
-nt=len(z.time)
-for t in range(nt):
-         ac.update_progress(t/nt)
-         moms = vor.calc_moments(z10[t,:],lats,lons,hemisphere='SH',field_type='GPH',edge=args.edge*1000)
-         aspects[t] = moms['aspect_ratio']
-         latc[t] = moms['centroid_latitude']
-         lonc[t] = moms['centroid_longitude']
-
-aspx = xr.DataArray(aspects,coords=[z.time],name='aspect_ratio')
-latx = xr.DataArray(latc,coords=[z.time],name='centroid_latitude')
-lonx = xr.DataArray(lonc,coords=[z.time],name='centroid_longitude')
+if len(args.z_files) > 1 and '{0}' not in args.outFile:
+    parser.error('-o needs {0} in the file name if several input files are given.')
 
 #outFile = 'results/vxmoms_composite_{0}.nc'.format(args.label)
-outFile = args.outFile
-xr.merge([aspx,latx,lonx]).to_netcdf(outFile)
-print(outFile)
+fields = [(z_file,OpenZ(z_file)) for z_file in args.z_files]
+ntot = sum(len(z.time) for _,z in fields)
+stats  = NewPipelineStats()
+writer = StartWriter(depth=args.depth,stats=stats)
+done = 0
+parts = []
+for z_file,z,last in PrefetchChunks(fields,chunk=args.chunk,depth=args.depth,stats=stats):
+    ac.update_progress(done/ntot)
+    parts.append(ComputeMoments(z))
+    done += len(z.time)
+    if last:
+        label = os.path.basename(z_file).split('.')[1] if '.' in os.path.basename(z_file) else ''
+        outFile = args.outFile.format(label)
+        WriteQueued(writer,xr.concat(parts,dim='time'),outFile,stats)
+        parts = []
+StopWriter(writer)
+PrintPipelineStats(stats)
@@ -1,16 +1,19 @@
 import xarray as xr
 from aostools import climate as ac
 from dask.diagnostics import ProgressBar
+from glob import glob
+from DynVar_SH_SSW.functions import OpenGeopotentialHeight, ToNetCDF
 
 data_dir = '/srv/ccrc/AtmMJ/shared/ERA5/'
 
 
 clim = ['1981','2010']
 
-z = xr.open_mfdataset(data_dir+'ERA5_dm.*.z.nc')
-# convert geopotential to geopotential height
-z = z.z/9.81
-z = ac.StandardGrid(z,rename=True)
+files = glob(data_dir+'ERA5_dm.*.z.nc')
+files.sort()
+# geopotential height on standard grid
+#  read from SH cache if present (see create_sh_cache.py)
+z = OpenGeopotentialHeight(files)
 
 # polar cap average
 z = ac.GlobalAvgXr(z,[-90,-60]).mean('lon')
@@ -24,7 +27,7 @@ za = z.groupby('time.dayofyear') - z_clim
 zs = za.groupby('time.dayofyear')/za.groupby('time.dayofyear').std()
 zs = -zs
 
-delayed = zs.to_netcdf('zpc_sam/zpc_sam.nc',compute=False)
+delayed = ToNetCDF(zs,'zpc_sam/zpc_sam.nc',compute=False)
 with ProgressBar():
     delayed.compute()
 
@@ -0,0 +1,12 @@
+from DynVar_SH_SSW.functions import CreateSHCache
+import argparse
+parser = argparse.ArgumentParser(description='Write SH only, geopotential height, standard grid cache of raw ERA5 geopotential files.')
+parser.add_argument('files',nargs='+',help='Raw geopotential files, e.g. ERA5_dm.*.z.nc.')
+parser.add_argument('-c',dest='cache_dir',default=None,help='Cache directory. If None, use sh_cache/ in the directory of each file.')
+parser.add_argument('-Z',dest='z',default='z',help='Name of geopotential variable.')
+parser.add_argument('-f',dest='overwrite',action='store_true',help='Re-create cache even if it is up to date.')
+args = parser.parse_args()
+
+for src in args.files:
+    cache_file = CreateSHCache(src,args.cache_dir,var=args.z,overwrite=args.overwrite)
+    print(cache_file)
@@ -13,19 +13,29 @@ do
     mean_dict["${levels[$j]}"]=${means[$j]}
 done
 
-for file in $shared/ERA5/ERA5_dm.*.z.nc
+files=$shared/ERA5/ERA5_dm.*.z.nc
+# geopotential height, SH only, standard grid. only written once.
+python $repdir/DynVar_SH_SSW/create_sh_cache.py $files || exit 1
+
+# all years in one call: the next year is read while the current one is computed
+#  {0} in output file names is replaced by the year
+for level in ${levels[@]}
 do
-    for level in ${levels[@]}
+    # "create_vortex_moments.sh sweep": all edges within +-2km from one pass
+    if [ "$1" == "sweep" ]
+    then
+	first=$(echo "${mean_dict[$level]}-2.0" |bc -l)
+	last=$(echo "${mean_dict[$level]}+2.0" |bc -l)
+	echo "${level}hPa, ${first}-${last}km"
+	outFile=ERA5_vxmoms_{0}_${level}hPa_sweep.nc
+	python $repdir/DynVar_SH_SSW/compute_vortex_moments.py -z $files -l $level -E $first $last 201 -o $outFile
+	continue
+    fi
+    for delta_edge in -2.0 -1.5 -1.0 -0.5 +0.0 +0.5 +1.0 +1.5 +2.0
     do
-	for delta_edge in -2.0 -1.5 -1.0 -0.5 +0.0 +0.5 +1.0 +1.5 +2.0
-	do
-	    edge=$(echo "${mean_dict[$level]}$delta_edge" |bc -l)
-	    echo "$file; ${level}hPa, ${edge}km"
-            ncap2 -s 'z=z/9.81' $file -O tmp.nc
-	    pre=${file%.z.nc}
-	    year=${pre#*.}
-	    outFile=ERA5_vxmoms_${year}_${level}hPa_${edge}km.nc
-	    python $repdir/DynVar_SH_SSW/compute_vortex_moments.py -z tmp.nc -l $level -e $edge -o $outFile
-	done
+	edge=$(echo "${mean_dict[$level]}$delta_edge" |bc -l)
+	echo "${level}hPa, ${edge}km"
+	outFile=ERA5_vxmoms_{0}_${level}hPa_${edge}km.nc
+	python $repdir/DynVar_SH_SSW/compute_vortex_moments.py -z $files -l $level -e $edge -o $outFile
     done
 done
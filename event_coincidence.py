@@ -0,0 +1,37 @@
+import xarray as xr
+import numpy as np
+import os
+import time
+from glob import glob
+from DynVar_SH_SSW.functions import EventIntervals, CoincidenceMatrix, ToNetCDF
+import argparse
+parser = argparse.ArgumentParser(description='Coincidence matrix of events between all detection configurations.')
+parser.add_argument('-i',dest='inFiles',default=['events/events_*.nc'],nargs='+',help='Event files written by zpc_sam_event_freq.py and vxmoms_event_freq.py. Wildcards are allowed.')
+parser.add_argument('-t',dest='tol',default=0,type=float,help='Lead-lag tolerance [days]: events coincide if they overlap or are separated by at most this many days.')
+parser.add_argument('-s',dest='seasons',default=None,nargs='+',help='Only use these seasons.')
+parser.add_argument('-o',dest='outFile',default=None,help='Name of output file.')
+args = parser.parse_args()
+
+files = []
+for pattern in args.inFiles:
+    files = files + glob(pattern)
+files.sort()
+
+intervals = {}
+for inFile in files:
+    events = xr.open_dataset(inFile)
+    if args.seasons is not None:
+        events = events.sel(season=args.seasons)
+    label = os.path.basename(inFile).replace('events_','').replace('.nc','')
+    intervals.update(EventIntervals(events,label))
+
+t0 = time.perf_counter()
+coinc = CoincidenceMatrix(intervals,tol=args.tol)
+print('{0} configurations, {1} events: coincidence matrix in {2:.2f}s'.format(len(intervals),int(coinc.events.sum()),time.perf_counter()-t0))
+
+if args.outFile is None:
+    outFile = 'events/coincidence_t{0:g}d.nc'.format(args.tol)
+else:
+    outFile = args.outFile
+ToNetCDF(coinc,outFile)
+print(outFile)
@@ -1,8 +1,490 @@
 import xarray as xr
 import os
 import numpy as np
+import time
+from queue import Queue, Empty, Full
+from threading import Thread
 
 
+## NetCDF output profiles
+#  'timeseries': analysis reads long time series at one level/edge/...,
+#                so each chunk holds all time steps of one point.
+#  'field':      vortex moments read one lat-lon field per time step and level,
+#                so each chunk holds one time step at one level.
+#  floating point data is stored as float32 with zlib and shuffle in both.
+
+def EncodingProfile(ds,profile='timeseries',complevel=4,time='time',chunk_size=2**18,spatial=('lat','lon')):
+    '''
+    NetCDF encoding for all data variables of a dataset following an output profile.
+
+    INPUTS:
+        ds:        xarray.Dataset to be written
+        profile:   'timeseries' or 'field'
+        complevel: zlib compression level
+        time:      name of time dimension
+        chunk_size: target number of values per chunk for the 'timeseries' profile
+        spatial:   names of horizontal dimensions, kept whole in the 'field' profile
+    OUTPUTS:
+        encoding: dictionary to be passed to to_netcdf(encoding=...)
+    '''
+    if profile not in ['timeseries','field']:
+        raise ValueError('unknown output profile '+str(profile))
+    encoding = {}
+    for var in ds.data_vars:
+        da = ds[var]
+        # leave strings, dates etc to xarray
+        if da.dtype.kind not in 'fiu' or da.ndim == 0:
+            continue
+        enc = {'zlib':True,'shuffle':True,'complevel':complevel}
+        if da.dtype.kind == 'f':
+            enc['dtype'] = 'float32'
+        if time in da.dims:
+            if profile == 'timeseries':
+                # all time steps in each chunk, other dimensions filled up to chunk_size
+                chunks = []
+                nother = max(1,chunk_size//da.sizes[time])
+                for d in da.dims[::-1]:
+                    if d == time:
+                        chunks.append(da.sizes[d])
+                    else:
+                        chunks.append(max(1,min(da.sizes[d],nother)))
+                        nother = max(1,nother//da.sizes[d])
+                enc['chunksizes'] = tuple(chunks[::-1])
+            else:
+                enc['chunksizes'] = tuple(da.sizes[d] if d in spatial else 1 for d in da.dims)
+        encoding[var] = enc
+    return encoding
+
+def ToNetCDF(ds,filename,profile='timeseries',complevel=4,**kwargs):
+    '''
+    Write a dataset or data array to netCDF with the encoding of an output profile.
+     Further keyword arguments are passed to to_netcdf.
+
+    INPUTS:
+        ds:        xarray.Dataset or xarray.DataArray to be written
+        filename:  name of output file
+        profile:   'timeseries' or 'field', see EncodingProfile
+        complevel: zlib compression level
+    OUTPUTS:
+        return value of to_netcdf, i.e. a dask.delayed object if compute=False
+    '''
+    if isinstance(ds,xr.DataArray):
+        # same name as xarray uses, so open_dataarray restores unnamed arrays
+        ds = ds.to_dataset(name=ds.name if ds.name is not None else '__xarray_dataarray_variable__')
+    encoding = EncodingProfile(ds,profile,complevel)
+    return ds.to_netcdf(filename,encoding=encoding,**kwargs)
+
+def OpenMFDataset(paths,parallel=True,**kwargs):
+    '''
+    Open many netCDF files as one dataset, concatenating along time.
+     File metadata are read in parallel, and only variables with a time
+     dimension are concatenated; all other variables and coordinates are
+     taken from the first file without comparing.
+     Further keyword arguments are passed to xarray.open_mfdataset.
+
+    INPUTS:
+        paths:    file name pattern or list of file names
+        parallel: open files in parallel with dask
+    OUTPUTS:
+        ds: xarray.Dataset
+    '''
+    options = {'combine':'by_coords','data_vars':'minimal','coords':'minimal','compat':'override'}
+    options.update(kwargs)
+    return xr.open_mfdataset(paths,parallel=parallel,**options)
+
+
+## Southern Hemisphere cache of ERA5 geopotential height
+#  raw ERA5_dm.*.z.nc files are global geopotential on the native grid.
+#  The cache holds geopotential height [m] on the standard grid, SH only.
+
+def SHCacheFile(src,cache_dir=None):
+    '''
+    Name of the SH cache file for a given source file. The name is keyed by
+     the source file name, a short hash of its full path, and its modification
+     time, so that a changed source never matches an old cache, and sources
+     with the same name in different directories can share a cache directory.
+
+    INPUTS:
+        src:       path to raw geopotential file
+        cache_dir: directory of the cache. if None, use sh_cache/ next to src
+    OUTPUTS:
+        cache_file: path to cache file (which may or may not exist)
+    '''
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(src)),'sh_cache')
+    import hashlib
+    mtime = int(os.path.getmtime(src))
+    base  = os.path.basename(src)
+    if base.endswith('.nc'):
+        base = base[:-3]
+    path_hash = hashlib.md5(os.path.abspath(src).encode()).hexdigest()[:8]
+    return os.path.join(cache_dir,'{0}.sh.{1}.{2}.nc'.format(base,path_hash,mtime))
+
+def FindSHCache(src,cache_dir=None):
+    '''
+    Returns the SH cache file of src if it exists and is up to date, None otherwise.
+
+    INPUTS:
+        src:       path to raw geopotential file
+        cache_dir: directory of the cache. if None, use sh_cache/ next to src
+    '''
+    cache_file = SHCacheFile(src,cache_dir)
+    if os.path.isfile(cache_file):
+        return cache_file
+    return None
+
+def CreateSHCache(src,cache_dir=None,var='z',lat_max=0.,complevel=4,overwrite=False):
+    '''
+    Write the SH cache of a raw geopotential file: geopotential is converted
+     to geopotential height, put on the standard grid, and cut to the Southern
+     Hemisphere. Data is written with the 'field' output profile, as
+     the vortex moments are computed one time step at a time.
+    Stale caches of the same source file (older modification times) are removed.
+
+    INPUTS:
+        src:       path to raw geopotential file
+        cache_dir: directory of the cache. if None, use sh_cache/ next to src
+        var:       name of geopotential variable in src
+        lat_max:   northernmost latitude to keep
+        complevel: zlib compression level
+        overwrite: write cache even if an up to date version exists
+    OUTPUTS:
+        cache_file: path to cache file
+    '''
+    from aostools import climate as ac
+    from glob import glob
+    cache_file = SHCacheFile(src,cache_dir)
+    if os.path.isfile(cache_file) and not overwrite:
+        return cache_file
+    cache_dir = os.path.dirname(cache_file)
+    os.makedirs(cache_dir,exist_ok=True)
+    # remove caches of older versions of src. the path hash is part of
+    #  the pattern, so caches of other sources with the same name are kept
+    stale_files = glob(cache_file.rsplit('.',2)[0]+'.*.nc')
+    for stale in stale_files:
+        if stale != cache_file:
+            os.remove(stale)
+    # lazy, so that the cache is written one field at a time
+    with xr.open_dataset(src,chunks={'time':1}) as ds:
+        z = ds[var]/9.81
+        z = ac.StandardGrid(z,rename=True)
+        z = z.isel(lat=z.lat<=lat_max)
+        z.name = var
+        z.attrs['units'] = 'm'
+        z.attrs['long_name'] = 'geopotential height'
+        z.attrs['source_file'] = os.path.abspath(src)
+        z.attrs['source_mtime'] = int(os.path.getmtime(src))
+        # write to temporary file first so readers never see a partial cache
+        tmp_file = cache_file+'.tmp'
+        ToNetCDF(z,tmp_file,profile='field',complevel=complevel)
+    os.replace(tmp_file,cache_file)
+    return cache_file
+
+def OpenGeopotentialHeight(files,var='z',cache_dir=None):
+    '''
+    Open geopotential height from a list of raw ERA5 geopotential files.
+     If all files have an up to date SH cache, the cache is read. Otherwise,
+     the raw files are read, converted to geopotential height and regridded.
+
+    INPUTS:
+        files:     list of raw geopotential files
+        var:       name of geopotential variable in files
+        cache_dir: directory of the cache. if None, use sh_cache/ next to each file
+    OUTPUTS:
+        z: xarray.DataArray of geopotential height [m] on the standard grid
+    '''
+    from aostools import climate as ac
+    cache_files = [FindSHCache(f,cache_dir) for f in files]
+    if None not in cache_files:
+        return OpenMFDataset(cache_files)[var]
+    z = OpenMFDataset(files)[var]/9.81
+    return ac.StandardGrid(z,rename=True)
+
+
+## Vortex moments for a continuous range of vortex edges
+#  moments of (edge - Z) over the region Z < edge. Sorting the cap grid cells
+#  by Z once, the region for any edge is a prefix of the sorted cells, and
+#   M(edge) = edge*sum(w*x^a*y^b) - sum(w*Z*x^a*y^b)
+#  can be read off cumulative sums for any number of edges.
+
+def CapCoordinates(lats,lons,hemisphere='SH',cap_lat=0.):
+    '''
+    Polar stereographic coordinates and area weights of the grid cells of a polar cap.
+
+    INPUTS:
+        lats:       1D array of latitudes [degrees]
+        lons:       1D array of longitudes [degrees]
+        hemisphere: 'SH' or 'NH'
+        cap_lat:    equatorward boundary of the cap [degrees]
+    OUTPUTS:
+        lat_mask: boolean mask of latitudes inside the cap
+        x,y:      2D (lat,lon) stereographic coordinates of cap cells (unit sphere)
+        w:        2D (lat,lon) area weights of cap cells in the stereographic plane
+    '''
+    if hemisphere == 'SH':
+        lat_mask = lats <= -abs(cap_lat)
+    else:
+        lat_mask = lats >= abs(cap_lat)
+    phi = np.deg2rad(np.abs(lats[lat_mask]))
+    lam = np.deg2rad(lons)
+    r = np.tan(np.pi/4-phi/2)
+    x = r[:,np.newaxis]*np.cos(lam)[np.newaxis,:]
+    y = r[:,np.newaxis]*np.sin(lam)[np.newaxis,:]
+    # area element of the stereographic plane, as moments are taken in x,y
+    w = (np.cos(phi)/(1+np.sin(phi))**2)[:,np.newaxis]*np.ones_like(lam)[np.newaxis,:]
+    return lat_mask,x,y,w
+
+def EdgeSweepMomentsStep(field,edges,x,y,w):
+    '''
+    Vortex moments of one time step for many vortex edges, from one sort of the field.
+
+    INPUTS:
+        field: geopotential height of cap cells [m], any shape
+        edges: 1D array of vortex edges [m]
+        x,y:   stereographic coordinates of cap cells, same shape as field
+        w:     area weights of cap cells, same shape as field
+    OUTPUTS:
+        aspect_ratio, centroid_latitude, centroid_longitude: 1D arrays, one value per edge.
+          NaN where no cell is inside the vortex.
+    '''
+    field = np.ravel(field)
+    valid = np.isfinite(field)
+    order = np.argsort(field[valid])
+    zs = field[valid][order]
+    xs = np.ravel(x)[valid][order]
+    ys = np.ravel(y)[valid][order]
+    ws = np.ravel(w)[valid][order]
+    # moment kernels 1, x, y, x^2, y^2, xy
+    kernels = ws*np.array([np.ones_like(xs),xs,ys,xs**2,ys**2,xs*ys])
+    S0 = np.zeros((6,len(zs)+1))
+    S1 = np.zeros_like(S0)
+    S0[:,1:] = np.cumsum(kernels,axis=1)
+    S1[:,1:] = np.cumsum(kernels*zs,axis=1)
+    # number of cells with Z < edge
+    k = np.searchsorted(zs,edges,side='left')
+    M = edges*S0[:,k] - S1[:,k]
+    with np.errstate(invalid='ignore',divide='ignore'):
+        M00 = np.where(k > 0,M[0],np.nan)
+        xc = M[1]/M00
+        yc = M[2]/M00
+        J11 = M[3]/M00 - xc**2
+        J22 = M[4]/M00 - yc**2
+        J12 = M[5]/M00 - xc*yc
+        root = np.sqrt(4*J12**2+(J11-J22)**2)
+        aspect_ratio = np.sqrt(np.abs((J11+J22+root)/(J11+J22-root)))
+    centroid_latitude  = np.rad2deg(np.pi/2-2*np.arctan(np.sqrt(xc**2+yc**2)))
+    centroid_longitude = np.mod(np.rad2deg(np.arctan2(yc,xc)),360)
+    # np.mod returns 360 for tiny negative angles
+    centroid_longitude = np.where(centroid_longitude >= 360,0.,centroid_longitude)
+    return aspect_ratio,centroid_latitude,centroid_longitude
+
+def EdgeSweepMoments(z,edges,hemisphere='SH',cap_lat=0.,lat='lat',lon='lon',time='time'):
+    '''
+    Vortex moments (aspect ratio, centroid latitude and longitude) as a function
+     of time and vortex edge. For each time step, the cap grid cells are sorted
+     by geopotential height once, so the cost per time step is O(N log N)
+     independent of the number of edges.
+    Moments are taken in the polar stereographic plane, weighting the native lat-lon
+     cells by their area in that plane rather than interpolating to a Cartesian grid
+     as vortex_moments.vor.calc_moments does. For an analytic vortex, this
+     discretisation is within 0.009 in aspect ratio and 0.017 degrees in centroid
+     latitude of the exact moments on a 1 degree grid (0.0003 and 0.001 on a 0.25
+     degree grid, see check_edge_sweep.py -a). Differences to vor.calc_moments also
+     include the interpolation error of vor.calc_moments; check with check_edge_sweep.py -z.
+    Centroid latitude is given as a positive number in both hemispheres.
+
+    INPUTS:
+        z:          xarray.DataArray of geopotential height [m] with dimensions (time,lat,lon)
+        edges:      list of vortex edges [km]
+        hemisphere: 'SH' or 'NH'
+        cap_lat:    equatorward boundary of the cap [degrees]
+        lat,lon,time: names of dimensions
+    OUTPUTS:
+        moms: xarray.Dataset of aspect_ratio, centroid_latitude, centroid_longitude
+                with dimensions (time,edge). edge is in km.
+    '''
+    edges = np.asarray(edges,dtype=float)
+    lat_mask,x,y,w = CapCoordinates(z[lat].values,z[lon].values,hemisphere,cap_lat)
+    z = z.isel({lat:lat_mask}).transpose(time,lat,lon)
+    nt = len(z[time])
+    moms = np.full((3,nt,len(edges)),np.nan)
+    for t in range(nt):
+        moms[:,t,:] = EdgeSweepMomentsStep(z[t,:].values,edges*1000,x,y,w)
+    coords = [z[time],('edge',edges,{'units':'km'})]
+    names = ['aspect_ratio','centroid_latitude','centroid_longitude']
+    moms = xr.merge([xr.DataArray(m,coords=coords,name=n) for m,n in zip(moms,names)])
+    moms.attrs['method'] = 'edge sweep: moments of (edge-Z) over Z < edge in the polar stereographic plane, native lat-lon cells weighted by their area in that plane (not vortex_moments.vor.calc_moments)'
+    return moms
+
+
+## Pipelined reading and writing
+#  a reader thread decodes the next chunk of data while the current chunk is
+#  processed, and a writer thread writes finished results. Both talk to the
+#  main thread through bounded queues; time spent waiting on a queue is
+#  counted as a stall. xarray serializes access to netCDF/HDF5 files with a
+#  global lock, so reading and writing do not overlap with each other, but
+#  both overlap with computation.
+
+def NewPipelineStats():
+    '''
+    Returns a dictionary of counters filled by PrefetchChunks and StartWriter.
+    '''
+    return {'read_chunks':0,'read_bytes':0,'read_time':0.,
+            'read_stalls':0,'read_stall_time':0.,
+            'prefetch_stalls':0,'prefetch_stall_time':0.,
+            'write_files':0,'write_time':0.,
+            'write_stalls':0,'write_stall_time':0.,
+            'start_time':time.perf_counter()}
+
+def _TimedPut(queue,item,stats,name):
+    '''
+    Put item into queue, counting a stall in stats if the queue is full.
+    '''
+    try:
+        queue.put_nowait(item)
+    except Full:
+        t0 = time.perf_counter()
+        queue.put(item)
+        stats[name+'_stalls'] += 1
+        stats[name+'_stall_time'] += time.perf_counter()-t0
+
+def _TimedGet(queue,stats,name):
+    '''
+    Get item from queue, counting a stall in stats if the queue is empty.
+    '''
+    try:
+        return queue.get_nowait()
+    except Empty:
+        t0 = time.perf_counter()
+        item = queue.get()
+        stats[name+'_stalls'] += 1
+        stats[name+'_stall_time'] += time.perf_counter()-t0
+        return item
+
+def PrefetchChunks(fields,chunk=None,depth=2,stats=None,time_dim='time'):
+    '''
+    Generator loading chunks of data along time in a background thread, up to
+     depth chunks ahead of the consumer.
+
+    INPUTS:
+        fields:   list of (key,xarray.DataArray). Data arrays are read in order.
+        chunk:    number of time steps per chunk. if None, read each field in one go.
+        depth:    maximum number of loaded chunks waiting in the queue.
+        stats:    dictionary from NewPipelineStats() to update. if None, no stats are kept.
+        time_dim: name of time dimension
+    OUTPUTS:
+        yields (key,da,last): da is a loaded chunk of the field with key,
+                              last is True for the last chunk of each field.
+    '''
+    if stats is None:
+        stats = NewPipelineStats()
+    queue = Queue(maxsize=depth)
+    done = object()
+    def _read():
+        try:
+            for key,da in fields:
+                nt = len(da[time_dim])
+                step = nt if chunk is None else chunk
+                for t0 in range(0,nt,step):
+                    tr = time.perf_counter()
+                    part = da.isel({time_dim:slice(t0,t0+step)}).load()
+                    stats['read_time'] += time.perf_counter()-tr
+                    stats['read_chunks'] += 1
+                    stats['read_bytes'] += part.nbytes
+                    _TimedPut(queue,(key,part,t0+step >= nt),stats,'prefetch')
+        except Exception as e:
+            queue.put(e)
+            return
+        queue.put(done)
+    reader = Thread(target=_read,daemon=True)
+    reader.start()
+    while True:
+        item = _TimedGet(queue,stats,'read')
+        if item is done:
+            break
+        if isinstance(item,Exception):
+            raise item
+        yield item
+    reader.join()
+
+def StartWriter(depth=2,stats=None,profile='timeseries'):
+    '''
+    Start a background thread writing netCDF files.
+     Put (xarray.Dataset,filename) into the returned queue to write a file,
+     and call StopWriter once all files have been queued.
+
+    INPUTS:
+        depth: maximum number of datasets waiting to be written.
+        stats: dictionary from NewPipelineStats() to update.
+        profile: output profile of written files, see EncodingProfile
+    OUTPUTS:
+        writer: tuple of (queue,thread,errors) to be passed to WriteQueued and StopWriter
+    '''
+    if stats is None:
+        stats = NewPipelineStats()
+    queue  = Queue(maxsize=depth)
+    errors = []
+    def _write():
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            if errors:
+                continue
+            ds,filename = item
+            try:
+                t0 = time.perf_counter()
+                ToNetCDF(ds,filename,profile=profile)
+                stats['write_time'] += time.perf_counter()-t0
+                stats['write_files'] += 1
+                print(filename)
+            except Exception as e:
+                errors.append(e)
+    thread = Thread(target=_write,daemon=True)
+    thread.start()
+    return queue,thread,errors
+
+def WriteQueued(writer,ds,filename,stats=None):
+    '''
+    Queue a dataset for writing by a writer from StartWriter.
+    '''
+    queue,thread,errors = writer
+    if errors:
+        raise errors[0]
+    if stats is None:
+        queue.put((ds,filename))
+    else:
+        _TimedPut(queue,(ds,filename),stats,'write')
+
+def StopWriter(writer):
+    '''
+    Wait for all queued files to be written, and stop the writer thread.
+     Re-raises the first error encountered while writing.
+    '''
+    queue,thread,errors = writer
+    queue.put(None)
+    thread.join()
+    if errors:
+        raise errors[0]
+
+def PrintPipelineStats(stats):
+    '''
+    Print throughput and stall counters of a reader/writer pipeline.
+     Many read stalls mean the computation waits for I/O: increase depth.
+     Many prefetch stalls mean the reader is ahead: depth can be decreased.
+    '''
+    wall = time.perf_counter()-stats['start_time']
+    mb = stats['read_bytes']/1024**2
+    lines = [
+        'pipeline wall time:   {0:8.1f}s'.format(wall),
+        'read:                 {0:8.1f}s, {1} chunks, {2:.1f} MiB, {3:.1f} MiB/s'.format(stats['read_time'],stats['read_chunks'],mb,mb/max(stats['read_time'],1e-9)),
+        'read stalls:          {0:8.1f}s, {1} times (compute waited for reader)'.format(stats['read_stall_time'],stats['read_stalls']),
+        'prefetch stalls:      {0:8.1f}s, {1} times (reader waited for compute)'.format(stats['prefetch_stall_time'],stats['prefetch_stalls']),
+        'write:                {0:8.1f}s, {1} files'.format(stats['write_time'],stats['write_files']),
+        'write stalls:         {0:8.1f}s, {1} times (compute waited for writer)'.format(stats['write_stall_time'],stats['write_stalls']),
+    ]
+    print(os.linesep.join(lines))
+
 
 def DetectMinMaxPeriods(ds,thresh,sep=20,period=7,time='time',kind='auto'):
     '''
@@ -141,3 +623,140 @@ def AssignUniqueEvent(events,unique_events):
             diffs = unique_events - event
             indx.append(np.argmin(np.abs(diffs)))
     return np.array(indx)
+
+
+## Coincidence of events across detection configurations
+#  one configuration is one combination of input (file), season, variable and
+#  percentile. Events of each configuration are intervals [onset,end].
+
+def EventIntervals(events,label=''):
+    '''
+    Flatten an events dataset into onset/end intervals per detection configuration.
+
+    INPUTS:
+        events: xr.Dataset with onset_date and end_date along dimension event,
+                 and any further dimensions (season, percentile, variable, ...)
+                 as constructed in zpc_sam_event_freq.py and vxmoms_event_freq.py
+        label:  prefix of configuration names
+    OUTPUTS:
+        intervals: dictionary of configuration name -> (onsets,ends),
+                    where onsets and ends are arrays of days since 1970-01-01
+    '''
+    dates = xr.merge([events.onset_date,events.end_date])
+    other_dims = [d for d in dates.onset_date.dims if d != 'event']
+    if other_dims:
+        dates = dates.stack(config=other_dims).transpose('config','event')
+        names = [' '.join([label]+[str(k) for k in np.atleast_1d(c)]) for c in dates.config.values]
+    else:
+        dates = dates.expand_dims('config')
+        names = [label]
+    intervals = {}
+    for name,onsets,ends in zip(names,dates.onset_date.values,dates.end_date.values):
+        valid = ~np.isnat(onsets)
+        intervals[name.strip()] = (onsets[valid].astype('datetime64[D]').astype(float),
+                                   ends[valid].astype('datetime64[D]').astype(float))
+    return intervals
+
+def CoincidenceMatrix(intervals,tol=0,max_pairs=2**24):
+    '''
+    Count coinciding events between all pairs of detection configurations.
+     An event of configuration i coincides with configuration j if it overlaps
+     an event of j, or if the gap between the two events is at most tol days.
+     All events are sorted by onset once and swept in that order: the events
+     coinciding with an event and starting after it are those starting before
+     its end+tol, a contiguous range of the sorted list. Each coinciding pair
+     is visited once, so the cost is O(E*log(E) + H) for E events with H
+     coinciding pairs, independent of the number of configurations.
+    Within each configuration, no event may contain another (as is the case
+     for DetectMinMaxPeriods), so that the closest coinciding event of a
+     configuration is always a neighbour in that configuration's onset order.
+
+    INPUTS:
+        intervals: dictionary of configuration name -> (onsets,ends) in days,
+                    as returned by EventIntervals
+        tol:       lead-lag tolerance [days]
+        max_pairs: maximum number of coinciding pairs held in memory at once
+    OUTPUTS:
+        coinc: xr.Dataset with dimensions (config,other) of
+          coincidence: number of events of config coinciding with an event of other
+          fraction:    coincidence divided by number of events of config
+          mean_lag:    mean onset of other minus onset of config [days] over
+                        coinciding events. positive if config leads. For each
+                        event, the lag is taken to the coinciding event of other
+                        with the closest onset (the earlier one if tied).
+         and number of events per configuration.
+    '''
+    names = list(intervals.keys())
+    nconf = len(names)
+    counts = np.array([len(intervals[n][0]) for n in names],dtype=int)
+    config = np.repeat(np.arange(nconf),counts)
+    onsets = np.concatenate([intervals[n][0] for n in names]) if nconf else np.zeros(0)
+    ends   = np.concatenate([intervals[n][1] for n in names]) if nconf else np.zeros(0)
+    if not (np.all(np.isfinite(onsets)) and np.all(np.isfinite(ends))) or np.any(ends < onsets):
+        raise ValueError('CoincidenceMatrix: events need finite onsets and ends, with ends not before onsets.')
+    order  = np.lexsort((ends,onsets))
+    onsets,ends,config = onsets[order],ends[order],config[order]
+    nevents = len(onsets)
+    # previous and next event of the same configuration in onset order (-1/nevents if none)
+    by_conf = np.lexsort((np.arange(nevents),config))
+    same = np.zeros(nevents,dtype=bool)
+    same[1:] = config[by_conf[1:]] == config[by_conf[:-1]]
+    prev_same = np.full(nevents,-1)
+    prev_same[by_conf[1:][same[1:]]] = by_conf[:-1][same[1:]]
+    next_same = np.full(nevents,nevents)
+    next_same[by_conf[:-1][same[1:]]] = by_conf[1:][same[1:]]
+    if np.any(ends[prev_same[prev_same >= 0]] > ends[prev_same >= 0]):
+        raise ValueError('CoincidenceMatrix: events of one configuration must not contain each other.')
+    pairs = [np.zeros(0,dtype=int)]
+    lags  = [np.zeros(0)]
+    if nevents > 0:
+        # coinciding events starting at or after each event
+        hi = np.searchsorted(onsets,ends+tol,side='right')
+        width = hi-np.arange(nevents)
+        # split the sweep into blocks of events with at most ~max_pairs pairs
+        cum = np.cumsum(width)
+        bounds = np.searchsorted(cum,np.arange(max_pairs,cum[-1],max_pairs),side='left')+1
+        bounds = np.unique(np.clip(np.concatenate([[0],bounds,[nevents]]),0,nevents))
+        for b0,b1 in zip(bounds[:-1],bounds[1:]):
+            w = width[b0:b1]
+            a = np.repeat(np.arange(b0,b1),w)
+            j = np.arange(len(a))-np.repeat(np.cumsum(w)-w,w)+a
+            lag = onsets[j]-onsets[a]
+            # event a, configuration of j: j is the closest event after a if it
+            #  is the first of its configuration at or after a. it is counted
+            #  here unless the closest event before a also coincides, in which
+            #  case the cell is counted from that pair below
+            p = prev_same[j]
+            first_after = p < a
+            before_hit = (p >= 0) & (ends[np.maximum(p,0)]+tol >= onsets[a])
+            use = first_after & ~before_hit
+            pairs.append(config[a[use]]*nconf+config[j[use]])
+            lags.append(lag[use])
+            # event j, configuration of a: a is the closest event before j if
+            #  the next event of its configuration is at or after j. compare
+            #  with the closest event after j, which is that next event
+            n = next_same[a]
+            last_before = (n >= j) & (a != j)
+            nn = np.minimum(n,nevents-1)
+            after_hit = (n < nevents) & (onsets[nn] <= ends[j]+tol)
+            lag_after = np.where(after_hit,onsets[nn]-onsets[j],np.inf)
+            closest = np.where(lag <= lag_after,-lag,lag_after)
+            pairs.append(config[j[last_before]]*nconf+config[a[last_before]])
+            lags.append(closest[last_before])
+    pairs = np.concatenate(pairs)
+    coincidence = np.bincount(pairs,minlength=nconf*nconf)
+    lag_sum = np.bincount(pairs,weights=np.concatenate(lags),minlength=nconf*nconf)
+    coincidence = coincidence.reshape(nconf,nconf)
+    lag_sum = lag_sum.reshape(nconf,nconf)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        fraction = coincidence/counts[:,np.newaxis]
+        mean_lag = lag_sum/coincidence
+    coords = [('config',names),('other',names)]
+    coinc = xr.merge([
+        xr.DataArray(coincidence,coords=coords,name='coincidence'),
+        xr.DataArray(fraction,coords=coords,name='fraction'),
+        xr.DataArray(mean_lag,coords=coords,name='mean_lag',attrs={'units':'days'}),
+        xr.DataArray(counts,coords=[coords[0]],name='events'),
+        ])
+    coinc.attrs['tolerance'] = tol
+    return coinc
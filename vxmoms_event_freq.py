@@ -28,7 +28,7 @@ roll = 7
 
 event_sep = 20
 
-vxmoms = xr.open_mfdataset('vxmoms/ERA5_vxmoms_*_{0}hPa_{1}km.nc'.format(level,edge))
+vxmoms = OpenMFDataset('vxmoms/ERA5_vxmoms_*_{0}hPa_{1}km.nc'.format(level,edge))
 vxmoms.load()
 
 percentiles = {}
@@ -93,6 +93,10 @@ for season,months in seasons.items():
 events = xr.concat(events,dim='season')
 del events.attrs['variable']
 events.attrs['method'] = 'individual {0}-day periods below/above given percentiles. Events are considered the same if spaced by less than {1} days'.format(roll,event_sep)
+# save onset/end intervals for coincidence with other detection methods (event_coincidence.py)
+outFile = 'events/events_vxmoms_r{0}_{1}hPa_{2}km.nc'.format(roll,level,edge)
+ToNetCDF(events,outFile)
+print(outFile)
 
 ## Now get some statistics
 # get the onset dates for each season, definition, and threshold
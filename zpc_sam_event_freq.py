@@ -80,6 +80,10 @@ for season,months in seasons.items():
 events = xr.concat(events,dim='season')
 del events.attrs['variable']
 events.attrs['method'] = 'individual {0}-day periods below/above given percentiles. Events are considered the same if spaced by less than {1} days'.format(roll,event_sep)
+# save onset/end intervals for coincidence with other detection methods (event_coincidence.py)
+outFile = 'events/events_sam_r{0}_{1}hPa.nc'.format(roll,level)
+ToNetCDF(events,outFile)
+print(outFile)
 
 ## Now get some statistics
 # get the onset dates for each season, definition, and threshold